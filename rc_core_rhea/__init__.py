@@ -1,19 +1,210 @@
 # (c) Copyright 2023 Rico Corp. All rights reserved.
+import bz2
+import copy
+import gzip
+import json
+import lzma
+import os
 import re
+import time
+import uuid
+import weakref
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import ChainMap
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Any, Callable, Optional, TypeVar
 
 from rich.tree import Tree
 
+_TTL_HEADERS = """@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rc: <http://ont.rheaproject.org/prov#> .
+
+<> a owl:Ontology ;
+    rdfs:label "rc_core_rhea generated"@en ;
+    owl:imports <provenance_squema.ttl> .
+
+"""
+
+
+class ExportMetrics:
+    """
+    Counters and timers collected during a single provenance export.
+
+    Timers are accumulated in seconds per stage ("generate", "clean_duplicates", "sort", "write").
+    "clean_duplicates" and "sort" are summed over every component of the tree and are included in "generate".
+    """
+
+    def __init__(self) -> None:
+        self.timers: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[stage] = self.timers.get(stage, 0.0) + time.perf_counter() - start
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @property
+    def duplicate_ratio(self) -> float:
+        generated = self.counters.get("triplets_generated", 0)
+        if not generated:
+            return 0.0
+        return self.counters.get("duplicates_removed", 0) / generated
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "timers": dict(self.timers),
+            "counters": dict(self.counters),
+            "duplicate_ratio": self.duplicate_ratio,
+        }
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+
+ExportHook = Callable[[str, ExportMetrics], None]
+
+_export_hooks: list[ExportHook] = []
+_active_metrics: ContextVar[Optional[ExportMetrics]] = ContextVar("_active_metrics", default=None)
+
+
+def register_export_hook(hook: ExportHook) -> None:
+    """Register a callback receiving (filename, metrics) after every instrumented export."""
+    _export_hooks.append(hook)
+
+
+def unregister_export_hook(hook: ExportHook) -> None:
+    _export_hooks.remove(hook)
+
+
+def _stage_timer(metrics: Optional[ExportMetrics], stage: str) -> AbstractContextManager[None]:
+    return metrics.timer(stage) if metrics is not None else nullcontext()
+
+
+# compression name -> (file extension, compress, decompress)
+_SHARD_CODECS: dict[str, tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "gzip": (".gz", lambda data: gzip.compress(data, mtime=0), gzip.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+    "bz2": (".bz2", bz2.compress, bz2.decompress),
+}
+
+
+def _split_into_shards(triplets: list[str], max_shard_bytes: int) -> Iterator[list[str]]:
+    shard: list[str] = []
+    shard_bytes = 0
+    for triplet in triplets:
+        triplet_bytes = len(triplet.encode()) + 1
+        if shard and shard_bytes + triplet_bytes > max_shard_bytes:
+            yield shard
+            shard, shard_bytes = [], 0
+        shard.append(triplet)
+        shard_bytes += triplet_bytes
+    if shard:
+        yield shard
+
+
+def _write_shard(path: str, triplets: list[str], compression: str) -> tuple[int, int]:
+    # Module level so it can be pickled into a ProcessPoolExecutor.
+    data = (_TTL_HEADERS + "".join(triplet + "\n" for triplet in triplets)).encode()
+    compressed = _SHARD_CODECS[compression][1](data)
+    with open(path, "wb") as file:
+        file.write(compressed)
+    return len(data), len(compressed)
+
+
+def _read_shard(path: str, compression: str) -> list[str]:
+    with open(path, "rb") as file:
+        text = _SHARD_CODECS[compression][2](file.read()).decode()
+    body = text.removeprefix(_TTL_HEADERS)
+    return [triplet + "\n" for triplet in body.split("\n\n") if triplet]
+
+
+def _triplet_subjects(triplet: str) -> list[str]:
+    # Statements start at column 0; predicate/object continuation lines are indented.
+    return [line.split(" ", 1)[0] for line in triplet.split("\n") if line and not line[0].isspace()]
+
+
+def _listed_shard_files(manifest_path: str) -> set[str]:
+    if not os.path.exists(manifest_path):
+        return set()
+    return {shard["file"] for shard in read_shard_manifest(manifest_path)["shards"]}
+
+
+def _remove_files(directory: str, files: Iterable[str]) -> None:
+    for file in files:
+        path = os.path.join(directory, file)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_shard_manifest(manifest_path: str) -> dict[str, Any]:
+    with open(manifest_path) as file:
+        manifest: dict[str, Any] = json.load(file)
+    return manifest
+
+
+def load_shard_triplets(manifest_path: str, shard_index: int) -> list[str]:
+    """Decompress a single shard listed in the manifest and return its triplets."""
+    manifest = read_shard_manifest(manifest_path)
+    shard = manifest["shards"][shard_index]
+    return _read_shard(os.path.join(os.path.dirname(manifest_path), shard["file"]), manifest["compression"])
+
+
+def query_shards(manifest_path: str, subject: str) -> list[str]:
+    """
+    Return the triplets describing rc:{subject}, decompressing only the shards that can contain them.
+
+    Every statement of a triplet is matched, so the Value and AttributeValue subjects declared inside attribute
+    triplets are found too. Shards whose sorted subject index in the manifest lacks the subject are skipped.
+    """
+    subject_iri = f"rc:{subject}"
+    manifest = read_shard_manifest(manifest_path)
+    directory = os.path.dirname(manifest_path)
+    triplets: list[str] = []
+    for shard in manifest["shards"]:
+        subjects = shard["subjects"]
+        index = bisect_left(subjects, subject_iri)
+        if index == len(subjects) or subjects[index] != subject_iri:
+            continue
+        shard_triplets = _read_shard(os.path.join(directory, shard["file"]), manifest["compression"])
+        triplets.extend(triplet for triplet in shard_triplets if subject_iri in _triplet_subjects(triplet))
+    return triplets
+
+
+_ComponentT = TypeVar("_ComponentT", bound="ProvenanceComponent")
+
 
 class ProvenanceComponent(ABC):
     """
     Abstract class for Pipeline components. Follows Composite design pattern.
+
+    Frozen components are immutable and can be shared between pipeline versions; thaw() returns a mutable
+    copy that shares attributes and children with the original until they are modified (copy-on-write).
     """
 
+    # lists of child components; together with _attributes they are copied on first write after thaw()
+    _child_fields: tuple[str, ...] = ()
+
     def __init__(self, name: str, attributes: dict[str, str] = {}):
         if not self._is_valid_rdf_string(name):
             raise ValueError(f"Invalid name: {name}")
         self._name = name
+        self._frozen = False
+        self._shared_fields: set[str] = set()
+        # live pipelines indexing this component, told when its children change
+        self._owners: weakref.WeakSet[DataPipeline] = weakref.WeakSet()
         self._attributes: dict[str, str] = {}
         for name, value in attributes.items():
             self.add_attribute(name, value)
@@ -23,8 +214,47 @@ class ProvenanceComponent(ABC):
         return self._name
 
     @property
-    def attributes(self) -> dict[str, str]:
-        return self._attributes
+    def attributes(self) -> Mapping[str, str]:
+        # read-only view: the dict may be shared with frozen versions, use add_attribute() to change it
+        return MappingProxyType(self._attributes)
+
+    @property
+    def is_frozen(self) -> bool:
+        return self._frozen
+
+    def freeze(self) -> None:
+        """Make the component and all its children immutable. Already frozen subtrees are skipped."""
+        if self._frozen:
+            return
+        self._frozen = True
+        for field in self._child_fields:
+            for child in getattr(self, field):
+                child.freeze()
+
+    def thaw(self: _ComponentT, name: Optional[str] = None) -> _ComponentT:
+        """Return a mutable copy of a frozen component, optionally renamed, sharing its structure."""
+        if not self._frozen:
+            raise ValueError(f"Component '{self.name}' must be frozen before it can be thawed.")
+        if name is not None and not self._is_valid_rdf_string(name):
+            raise ValueError(f"Invalid name: {name}")
+        clone = copy.copy(self)
+        clone._frozen = False
+        clone._shared_fields = {"_attributes", *self._child_fields}
+        clone._owners = weakref.WeakSet()
+        if name is not None:
+            clone._name = name
+        return clone
+
+    def _writable(self, field: str, notify: bool = True) -> Any:
+        if self._frozen:
+            raise ValueError(f"Component '{self.name}' is frozen; use thaw() to get a mutable copy.")
+        if field in self._shared_fields:
+            setattr(self, field, copy.copy(getattr(self, field)))
+            self._shared_fields.discard(field)
+        if notify and field in self._child_fields:
+            for owner in self._owners:
+                owner._dirty[id(self)] = self
+        return getattr(self, field)
 
     @abstractmethod
     def generate_triplets(self) -> list[str]:
@@ -43,7 +273,7 @@ class ProvenanceComponent(ABC):
             raise ValueError(f"Attribute name '{name}' contains unsupported characters.")
         if not self._is_valid_rdf_string(value):
             raise ValueError(f"Attribute value '{value}' contains unsupported characters.")
-        self._attributes[name] = value
+        self._writable("_attributes")[name] = value
 
     def _is_valid_rdf_string(self, rdf_string: str) -> bool:
         # Check for unsupported characters in the RDF string using regular expressions.
@@ -70,20 +300,121 @@ rc:{attribute_name}_{attribute_value} a rc:AttributeValue ;
     def _get_attvalue_names(self) -> str:
         return " , ".join([f"rc:{name}_{value}" for name, value in self.attributes.items()])
 
-    def save_triplets_to_file(self, filename: str) -> None:
-        with open(filename, "w") as file:
-            headers = """@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
-@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
-@prefix owl: <http://www.w3.org/2002/07/owl#> .
-@prefix rc: <http://ont.rheaproject.org/prov#> .
-
-<> a owl:Ontology ;
-    rdfs:label "rc_core_rhea generated"@en ;
-    owl:imports <provenance_squema.ttl> .
+    def _finalize_triplets(self, triplets: list[str]) -> list[str]:
+        metrics = _active_metrics.get()
+        if metrics is None:
+            return sorted(self.clean_duplicated_triplets(triplets))
+
+        with metrics.timer("clean_duplicates"):
+            unique_triplets = self.clean_duplicated_triplets(triplets)
+        # Children were already counted by their own call, so only the triplets emitted by this component are
+        # added: its main triplet plus one per attribute. Summed over the tree, generated - removed == written.
+        metrics.increment("triplets_generated", 1 + len(self.attributes))
+        metrics.increment("duplicates_removed", len(triplets) - len(unique_triplets))
+        with metrics.timer("sort"):
+            return sorted(unique_triplets)
+
+    def save_triplets_to_file(self, filename: str, metrics: Optional[ExportMetrics] = None) -> None:
+        """
+        Write the RDF definition of the component to filename.
+
+        Stage durations and counts are recorded into metrics when given, or when export hooks are registered.
+        """
+        if metrics is None and not _export_hooks:
+            self._write_triplets(filename, self.generate_triplets())
+            return
+
+        if metrics is None:
+            metrics = ExportMetrics()
+        triplets = self._generate_with_metrics(metrics)
+        with metrics.timer("write"):
+            self._write_triplets(filename, triplets)
+        metrics.increment("triplets_written", len(triplets))
+        metrics.increment("bytes_written", os.path.getsize(filename))
+
+        for hook in list(_export_hooks):
+            hook(filename, metrics)
+
+    def save_triplets_to_shards(
+        self,
+        directory: str,
+        max_shard_bytes: int = 64 * 1024 * 1024,
+        compression: str = "gzip",
+        max_workers: Optional[int] = None,
+        use_processes: bool = False,
+        metrics: Optional[ExportMetrics] = None,
+    ) -> str:
+        """
+        Write the RDF definition of the component to directory as compressed shards plus a JSON manifest.
+
+        Each shard is a standalone Turtle file holding at most max_shard_bytes of uncompressed triplets (a larger
+        triplet gets a shard of its own). Shards are compressed concurrently in a thread pool, or in a process pool
+        when use_processes is set. A previous export of the component in directory is replaced only once the new
+        shards and manifest are written; on failure it is left untouched. Returns the path of the manifest.
+        """
+        if compression not in _SHARD_CODECS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        if max_shard_bytes <= 0:
+            raise ValueError(f"Invalid max_shard_bytes: {max_shard_bytes}")
+
+        if metrics is None and _export_hooks:
+            metrics = ExportMetrics()
+        triplets = self._generate_with_metrics(metrics) if metrics is not None else self.generate_triplets()
+
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, f"{self.name}.manifest.json")
+        previous_files = _listed_shard_files(manifest_path)
+        # a fresh export id keeps the new shards from overwriting the ones the current manifest points to
+        export_id = uuid.uuid4().hex[:8]
+        temporary_file = f"{self.name}.manifest.json.{export_id}.tmp"
+        extension = _SHARD_CODECS[compression][0]
+        shards: list[dict[str, Any]] = []
+        futures: list[Future[tuple[int, int]]] = []
+        executor: Executor = ProcessPoolExecutor(max_workers) if use_processes else ThreadPoolExecutor(max_workers)
+        try:
+            with _stage_timer(metrics, "write"), executor:
+                for index, shard_triplets in enumerate(_split_into_shards(triplets, max_shard_bytes)):
+                    shard_file = f"{self.name}_{export_id}_{index:05d}.ttl{extension}"
+                    subjects = {subject for triplet in shard_triplets for subject in _triplet_subjects(triplet)}
+                    shards.append({"file": shard_file, "triplets": len(shard_triplets), "subjects": sorted(subjects)})
+                    futures.append(
+                        executor.submit(_write_shard, os.path.join(directory, shard_file), shard_triplets, compression)
+                    )
+                for shard, future in zip(shards, futures):
+                    shard["uncompressed_bytes"], shard["compressed_bytes"] = future.result()
+
+            temporary_path = os.path.join(directory, temporary_file)
+            with open(temporary_path, "w") as file:
+                json.dump({"component": self.name, "compression": compression, "shards": shards}, file, indent=2)
+            os.replace(temporary_path, manifest_path)
+        except BaseException:
+            _remove_files(directory, [temporary_file, *(shard["file"] for shard in shards)])
+            raise
+        _remove_files(directory, previous_files - {shard["file"] for shard in shards})
+
+        if metrics is not None:
+            metrics.increment("triplets_written", len(triplets))
+            metrics.increment("shards", len(shards))
+            metrics.increment("uncompressed_bytes", sum(shard["uncompressed_bytes"] for shard in shards))
+            metrics.increment("bytes_written", sum(shard["compressed_bytes"] for shard in shards))
+            for hook in list(_export_hooks):
+                hook(manifest_path, metrics)
+
+        return manifest_path
+
+    def _generate_with_metrics(self, metrics: ExportMetrics) -> list[str]:
+        token = _active_metrics.set(metrics)
+        try:
+            with metrics.timer("generate"):
+                return self.generate_triplets()
+        finally:
+            _active_metrics.reset(token)
 
-"""
-            file.write(headers)
-            for item in self.generate_triplets():
+    @staticmethod
+    def _write_triplets(filename: str, triplets: list[str]) -> None:
+        with open(filename, "w") as file:
+            file.write(_TTL_HEADERS)
+            for item in triplets:
                 file.write(item + "\n")
 
     @staticmethod
@@ -95,6 +426,26 @@ rc:{attribute_name}_{attribute_value} a rc:AttributeValue ;
         return unique_triplets
 
 
+_ComponentKey = tuple[type[ProvenanceComponent], str]
+_IndexLayers = ChainMap[_ComponentKey, ProvenanceComponent]
+# (parent key or None for the pipeline, child field, position in that field) of every reference to a component
+_ParentRef = tuple[Optional[_ComponentKey], str, int]
+_ParentLayers = ChainMap[_ComponentKey, tuple[_ParentRef, ...]]
+
+# versions derived from each other stack index layers; past this depth they are flattened into one
+_MAX_INDEX_LAYERS = 32
+
+
+def _component_key(component: ProvenanceComponent) -> _ComponentKey:
+    return type(component), component.name
+
+
+def _next_index_layer(layers: ChainMap[_ComponentKey, Any]) -> ChainMap[_ComponentKey, Any]:
+    if len(layers.maps) >= _MAX_INDEX_LAYERS:
+        return ChainMap({}, dict(layers))
+    return layers.new_child()
+
+
 class DataInstance(ProvenanceComponent):
     def __init__(self, name: str, attributes: dict[str, str] = {}):
         super().__init__(name, attributes)
@@ -113,7 +464,7 @@ class DataInstance(ProvenanceComponent):
         # define attribute value relationships
         triplets.extend(self._get_attribute_triplets())
 
-        return sorted(self.clean_duplicated_triplets(triplets))
+        return self._finalize_triplets(triplets)
 
     def generate_cli_tree(self) -> Tree:
         tree = Tree(f"[red]Instance[/]: {self.name}")
@@ -126,12 +477,14 @@ class DataInstance(ProvenanceComponent):
 
 
 class DataSet(ProvenanceComponent):
+    _child_fields = ("_containsData",)
+
     def __init__(self, name: str, attributes: dict[str, str] = {}):
         super().__init__(name, attributes)
         self._containsData: list[DataInstance] = []
 
     def add_data_instances(self, data_instances: list[DataInstance]) -> None:
-        self._containsData.extend(data_instances)
+        self._writable("_containsData").extend(data_instances)
 
     def _get_data_instance_names(self) -> str:
         return " , ".join([f"rc:{data_instance.name}" for data_instance in self._containsData])
@@ -156,7 +509,7 @@ class DataSet(ProvenanceComponent):
         for data in self._containsData:
             triplets.extend(data.generate_triplets())
 
-        return sorted(self.clean_duplicated_triplets(triplets))
+        return self._finalize_triplets(triplets)
 
     def generate_cli_tree(self) -> Tree:
         tree = Tree(f"[red]Dataset[/]: {self.name}")
@@ -178,16 +531,18 @@ class DataSet(ProvenanceComponent):
 
 
 class DataOperation(ProvenanceComponent):
+    _child_fields = ("_has_inputs", "_has_outputs")
+
     def __init__(self, name: str, attributes: dict[str, str] = {}):
         super().__init__(name, attributes)
         self._has_inputs: list[DataSet] = []
         self._has_outputs: list[DataSet] = []
 
     def add_input(self, data_set: list[DataSet]) -> None:
-        self._has_inputs.extend(data_set)
+        self._writable("_has_inputs").extend(data_set)
 
     def add_output(self, data_set: list[DataSet]) -> None:
-        self._has_outputs.extend(data_set)
+        self._writable("_has_outputs").extend(data_set)
 
     def _get_input_names(self) -> str:
         return " , ".join([f"rc:{input.name}" for input in self._has_inputs])
@@ -219,7 +574,7 @@ class DataOperation(ProvenanceComponent):
         for output in self._has_outputs:
             triplets.extend(output.generate_triplets())
 
-        return sorted(self.clean_duplicated_triplets(triplets))
+        return self._finalize_triplets(triplets)
 
     def generate_cli_tree(self) -> Tree:
         tree = Tree(f"[red]DataOp[/]: {self.name}")
@@ -249,12 +604,130 @@ class DataPipeline(ProvenanceComponent):
     Captures the provenance of a data pipeline and generates an RDF definition.
     """
 
+    _child_fields = ("_consists_of",)
+
     def __init__(self, name: str, attributes: dict[str, str] = {}):
         super().__init__(name, attributes)
         self._consists_of: list[DataOperation] = []
+        self._versions: tuple[DataPipeline, ...] = ()
+        # (type, name) of every descendant -> component, and -> where it is referenced. Components are identified
+        # by type and name, as in the RDF output. Built on first use, then layered between versions so an edit
+        # only touches its path.
+        self._index: Optional[_IndexLayers] = None
+        self._parents: Optional[_ParentLayers] = None
+        self._dirty: dict[int, ProvenanceComponent] = {}
+        self._owners.add(self)
+
+    @property
+    def versions(self) -> tuple["DataPipeline", ...]:
+        """Snapshots taken from this pipeline and the pipelines it was thawed from, oldest first."""
+        return self._versions
 
     def add_data_operations(self, data_operations: list[DataOperation]) -> None:
-        self._consists_of.extend(data_operations)
+        self._writable("_consists_of").extend(data_operations)
+
+    def get_component(self, component_type: type[_ComponentT], name: str) -> _ComponentT:
+        """Return the named operation, dataset or instance of this pipeline without thawing it."""
+        index, _ = self._refresh_index()
+        component = index.get((component_type, name))
+        if not isinstance(component, component_type):
+            raise ValueError(f"Pipeline '{self.name}' has no {component_type.__name__} named '{name}'.")
+        return component
+
+    def edit_data_operation(self, name: str) -> DataOperation:
+        """Return a mutable version of the named data operation, thawing it in this pipeline if frozen."""
+        return self._edit_component(DataOperation, name)
+
+    def edit_data_set(self, name: str) -> DataSet:
+        """
+        Return a mutable version of the named dataset, thawing it if frozen.
+
+        Every operation of this pipeline referencing the dataset, as input or output, gets the same copy.
+        """
+        return self._edit_component(DataSet, name)
+
+    def edit_data_instance(self, name: str) -> DataInstance:
+        """Return a mutable version of the named data instance, replacing it in every dataset of this pipeline."""
+        return self._edit_component(DataInstance, name)
+
+    def _edit_component(self, component_type: type[_ComponentT], name: str) -> _ComponentT:
+        if self._frozen:
+            raise ValueError(f"Component '{self.name}' is frozen; use thaw() to get a mutable copy.")
+        index, parents = self._refresh_index()
+        component = self._thaw_indexed(self.get_component(component_type, name), index, parents)
+        assert isinstance(component, component_type)
+        return component
+
+    def _thaw_indexed(
+        self, component: ProvenanceComponent, index: _IndexLayers, parents: _ParentLayers
+    ) -> ProvenanceComponent:
+        # Thaw the component once and path-copy the components referencing it, up to the pipeline.
+        if not component.is_frozen:
+            return component
+        key = _component_key(component)
+        replacement = component.thaw()
+        replacement._owners.add(self)
+        index[key] = replacement
+        for parent_key, field, position in parents.get(key, ()):
+            parent = self if parent_key is None else self._thaw_indexed(index[parent_key], index, parents)
+            parent._writable(field, notify=False)[position] = replacement
+        return replacement
+
+    def _refresh_index(self) -> tuple[_IndexLayers, _ParentLayers]:
+        if self._index is None or self._parents is None:
+            self._index, self._parents = ChainMap(), ChainMap()
+            self._dirty = {id(self): self}
+        while self._dirty:
+            _, component = self._dirty.popitem()
+            self._index_children(component, self._index, self._parents)
+        return self._index, self._parents
+
+    def _index_children(self, parent: ProvenanceComponent, index: _IndexLayers, parents: _ParentLayers) -> None:
+        parent_key = None if parent is self else _component_key(parent)
+        for field in parent._child_fields:
+            for position, child in enumerate(getattr(parent, field)):
+                key = _component_key(child)
+                child_parents = parents.get(key, ())
+                if (parent_key, field, position) not in child_parents:
+                    parents[key] = (*child_parents, (parent_key, field, position))
+                if key not in index:
+                    index[key] = child
+                    if not child.is_frozen:
+                        child._owners.add(self)
+                    self._index_children(child, index, parents)
+
+    def snapshot(self) -> "DataPipeline":
+        """
+        Record the current state as a frozen version and return it.
+
+        The operations, datasets and instances of the pipeline are frozen in place and shared with the snapshot:
+        references held by the caller become read-only and raise ValueError on add_attribute, add_input, etc.
+        The pipeline itself stays editable through add_data_operations, add_attribute and the edit_* methods,
+        which look components up in a name index shared with the snapshot and copy only the components on the
+        path to what changed. The index is built by the first snapshot or edit of a pipeline.
+        """
+        if self._frozen:
+            return self
+        index, parents = self._refresh_index()
+        for data_op in self._consists_of:
+            data_op.freeze()
+        frozen = copy.copy(self)
+        frozen._frozen = True
+        frozen._shared_fields = set()
+        frozen._dirty = {}
+        self._shared_fields = {"_attributes", *self._child_fields}
+        self._index, self._parents = _next_index_layer(index), _next_index_layer(parents)
+        self._versions = self._versions + (frozen,)
+        return frozen
+
+    def thaw(self, name: Optional[str] = None) -> "DataPipeline":
+        index, parents = self._refresh_index()
+        clone = super().thaw(name)
+        clone._versions = self._versions + (self,)
+        clone._index, clone._parents = _next_index_layer(index), _next_index_layer(parents)
+        clone._dirty = {}
+        clone._owners.add(clone)
+        return clone
 
     def _get_dataop_names(self) -> str:
         return " , ".join([f"rc:{data_op.name}" for data_op in self._consists_of])
@@ -279,7 +752,7 @@ class DataPipeline(ProvenanceComponent):
         for data_op in self._consists_of:
             triplets.extend(data_op.generate_triplets())
 
-        return sorted(self.clean_duplicated_triplets(triplets))
+        return self._finalize_triplets(triplets)
 
     def generate_cli_tree(self) -> Tree:
         tree = Tree(f"[red]Pipe[/]: {self.name}")
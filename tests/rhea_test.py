@@ -1,10 +1,24 @@
 # (c) Copyright 2023 Rico Corp. All rights reserved.
+import json
 from pathlib import Path
 
 import pytest
 from rich.tree import Tree
 
-from rc_core_rhea import DataInstance, DataOperation, DataPipeline, DataSet, ProvenanceComponent
+import rc_core_rhea
+from rc_core_rhea import (
+    DataInstance,
+    DataOperation,
+    DataPipeline,
+    DataSet,
+    ExportMetrics,
+    ProvenanceComponent,
+    load_shard_triplets,
+    query_shards,
+    read_shard_manifest,
+    register_export_hook,
+    unregister_export_hook,
+)
 
 
 class ConcreteComponent(ProvenanceComponent):
@@ -179,3 +193,231 @@ def test__data_pipeline__full_sample(tmp_path: Path) -> None:
         str(pipe.generate_triplets())
         == "['rc:0000001_png a rc:DataInstance ;\\n    rc:prefLabel \"0000001_png\"@en .\\n', 'rc:0000002_png a rc:DataInstance ;\\n    rc:prefLabel \"0000002_png\"@en .\\n', 'rc:0000003_png a rc:DataInstance ;\\n    rc:prefLabel \"0000003_png\"@en .\\n', 'rc:0000004_png a rc:DataInstance ;\\n    rc:prefLabel \"0000004_png\"@en .\\n', 'rc:0000005_png a rc:DataInstance ;\\n    rc:prefLabel \"0000005_png\"@en ;\\n    rc:hasAttributeValue rc:annotated_no .\\n', 'rc:0000006_png a rc:DataInstance ;\\n    rc:prefLabel \"0000006_png\"@en ;\\n    rc:hasAttributeValue rc:annotated_no .\\n', 'rc:D00000001_2023 a rc:DataSet ;\\n    rc:prefLabel \"D00000001_2023\"@en ;\\n    rc:containsData rc:0000005_png , rc:0000006_png ;\\n    rc:hasAttributeValue rc:type_raw , rc:annotated_no .\\n', 'rc:D00000002_2023 a rc:DataSet ;\\n    rc:prefLabel \"D00000002_2023\"@en ;\\n    rc:containsData rc:0000001_png , rc:0000002_png ;\\n    rc:hasAttributeValue rc:type_staging , rc:annotated_yes .\\n', 'rc:D00000003_2023_merge_output a rc:DataSet ;\\n    rc:prefLabel \"D00000003_2023_merge_output\"@en ;\\n    rc:containsData rc:0000003_png , rc:0000004_png .\\n', 'rc:annotated a rc:Attribute .\\nrc:no a rc:Value .\\nrc:annotated_no a rc:AttributeValue ;\\n    rc:hasAttribute rc:annotated ;\\n    rc:hasValue rc:no .\\n', 'rc:annotated a rc:Attribute .\\nrc:yes a rc:Value .\\nrc:annotated_yes a rc:AttributeValue ;\\n    rc:hasAttribute rc:annotated ;\\n    rc:hasValue rc:yes .\\n', 'rc:code a rc:Attribute .\\nrc:rc_merge a rc:Value .\\nrc:code_rc_merge a rc:AttributeValue ;\\n    rc:hasAttribute rc:code ;\\n    rc:hasValue rc:rc_merge .\\n', 'rc:code a rc:Attribute .\\nrc:rc_preview a rc:Value .\\nrc:code_rc_preview a rc:AttributeValue ;\\n    rc:hasAttribute rc:code ;\\n    rc:hasValue rc:rc_preview .\\n', 'rc:code_tag a rc:Attribute .\\nrc:0_0_1 a rc:Value .\\nrc:code_tag_0_0_1 a rc:AttributeValue ;\\n    rc:hasAttribute rc:code_tag ;\\n    rc:hasValue rc:0_0_1 .\\n', 'rc:code_tag a rc:Attribute .\\nrc:0_0_3 a rc:Value .\\nrc:code_tag_0_0_3 a rc:AttributeValue ;\\n    rc:hasAttribute rc:code_tag ;\\n    rc:hasValue rc:0_0_3 .\\n', 'rc:merge_op a rc:DataOperation ;\\n    rc:prefLabel \"merge_op\"@en ;\\n    rc:hasInput rc:D00000001_2023 , rc:D00000002_2023 ;\\n    rc:hasOutput rc:D00000003_2023_merge_output ;\\n    rc:hasAttributeValue rc:code_rc_merge , rc:code_tag_0_0_1 .\\n', 'rc:preview a rc:DataOperation ;\\n    rc:prefLabel \"preview\"@en ;\\n    rc:hasInput rc:D00000003_2023_merge_output ;\\n    rc:hasOutput rc:D00000003_2023_merge_output ;\\n    rc:hasAttributeValue rc:code_rc_preview , rc:code_tag_0_0_3 .\\n', 'rc:test_pipe a rc:DataPipeline ;\\n    rc:prefLabel \"test_pipe\"@en ;\\n    rc:consistsOf rc:merge_op , rc:preview ;\\n    rc:hasAttributeValue rc:version_0_0_1 .\\n', 'rc:type a rc:Attribute .\\nrc:raw a rc:Value .\\nrc:type_raw a rc:AttributeValue ;\\n    rc:hasAttribute rc:type ;\\n    rc:hasValue rc:raw .\\n', 'rc:type a rc:Attribute .\\nrc:staging a rc:Value .\\nrc:type_staging a rc:AttributeValue ;\\n    rc:hasAttribute rc:type ;\\n    rc:hasValue rc:staging .\\n', 'rc:version a rc:Attribute .\\nrc:0_0_1 a rc:Value .\\nrc:version_0_0_1 a rc:AttributeValue ;\\n    rc:hasAttribute rc:version ;\\n    rc:hasValue rc:0_0_1 .\\n']"  # noqa
     )
+
+
+def test__export_metrics__save_triplets_to_file(tmp_path: Path) -> None:
+    dataset = DataSet("dataset1", {"type": "raw"})
+    operation = DataOperation("operation1")
+    operation.add_input([dataset])
+    operation.add_output([dataset])
+
+    metrics = ExportMetrics()
+    file = tmp_path / "pipe.ttl"
+    operation.save_triplets_to_file(str(file), metrics)
+
+    assert set(metrics.timers) == {"generate", "clean_duplicates", "sort", "write"}
+    assert metrics.counters["triplets_written"] == len(operation.generate_triplets())
+    assert metrics.counters["bytes_written"] == file.stat().st_size
+    assert metrics.counters["triplets_generated"] == 5
+    assert metrics.counters["duplicates_removed"] == 2
+    assert metrics.counters["triplets_written"] == 3
+    assert metrics.duplicate_ratio == 2 / 5
+
+    exported = json.loads(metrics.to_json())
+    assert exported["counters"] == metrics.counters
+    assert exported["duplicate_ratio"] == metrics.duplicate_ratio
+
+
+def test__export_metrics__hooks(tmp_path: Path) -> None:
+    calls: list[tuple[str, ExportMetrics]] = []
+
+    def hook(filename: str, metrics: ExportMetrics) -> None:
+        calls.append((filename, metrics))
+
+    file = tmp_path / "instance.ttl"
+    register_export_hook(hook)
+    try:
+        DataInstance("instance1").save_triplets_to_file(str(file))
+    finally:
+        unregister_export_hook(hook)
+    DataInstance("instance2").save_triplets_to_file(str(file))
+
+    assert len(calls) == 1
+    assert calls[0][0] == str(file)
+    assert calls[0][1].counters["triplets_written"] == 1
+
+
+@pytest.mark.parametrize(
+    "compression, use_processes", [("gzip", False), ("lzma", False), ("bz2", False), ("gzip", True)]
+)
+def test__provenance_component__save_triplets_to_shards(tmp_path: Path, compression: str, use_processes: bool) -> None:
+    pipe = DataPipeline("pipe1", {"version": "0_0_1"})
+    for index in range(10):
+        operation = DataOperation(f"operation{index}", {"code": f"code{index}"})
+        operation.add_input([DataSet(f"dataset{index}")])
+        pipe.add_data_operations([operation])
+
+    metrics = ExportMetrics()
+    manifest_path = pipe.save_triplets_to_shards(
+        str(tmp_path / "shards"),
+        max_shard_bytes=300,
+        compression=compression,
+        max_workers=2,
+        use_processes=use_processes,
+        metrics=metrics,
+    )
+    manifest = read_shard_manifest(manifest_path)
+
+    assert manifest["compression"] == compression
+    assert len(manifest["shards"]) > 1
+    assert metrics.counters["shards"] == len(manifest["shards"])
+
+    loaded: list[str] = []
+    for index in range(len(manifest["shards"])):
+        loaded.extend(load_shard_triplets(manifest_path, index))
+    assert loaded == pipe.generate_triplets()
+
+    assert query_shards(manifest_path, "operation3") == [
+        triplet for triplet in loaded if triplet.startswith("rc:operation3 ")
+    ]
+    assert query_shards(manifest_path, "missing") == []
+    assert sum("rc:operation3" in shard["subjects"] for shard in manifest["shards"]) == 1
+    assert len(query_shards(manifest_path, "code3")) == 1
+    assert query_shards(manifest_path, "code3") == [triplet for triplet in loaded if "rc:code3 a rc:Value ." in triplet]
+    assert query_shards(manifest_path, "code_code3") == query_shards(manifest_path, "code3")
+
+    # re-exporting into the same directory drops the shards of the previous export
+    manifest_path = pipe.save_triplets_to_shards(str(tmp_path / "shards"), compression=compression)
+    assert len(read_shard_manifest(manifest_path)["shards"]) == 1
+    assert sorted(path.name for path in (tmp_path / "shards").iterdir()) == [
+        "pipe1.manifest.json",
+        read_shard_manifest(manifest_path)["shards"][0]["file"],
+    ]
+
+
+def test__provenance_component__save_triplets_to_shards_keeps_previous_export_on_failure(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    dataset = DataSet("dataset1", {"type": "raw"})
+    manifest_path = dataset.save_triplets_to_shards(str(tmp_path))
+    files = sorted(path.name for path in tmp_path.iterdir())
+
+    def failing_write_shard(path: str, triplets: list[str], compression: str) -> tuple[int, int]:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(rc_core_rhea, "_write_shard", failing_write_shard)
+    with pytest.raises(OSError):
+        DataSet("dataset1", {"type": "staging"}).save_triplets_to_shards(str(tmp_path))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == files
+    assert load_shard_triplets(manifest_path, 0) == dataset.generate_triplets()
+
+
+def test__provenance_component__save_triplets_to_shards_invalid_options(tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        DataInstance("instance1").save_triplets_to_shards(str(tmp_path), compression="zip")
+
+    with pytest.raises(ValueError):
+        DataInstance("instance1").save_triplets_to_shards(str(tmp_path), max_shard_bytes=0)
+
+
+def test__data_pipeline__snapshot_and_versions(tmp_path: Path) -> None:
+    dataset = DataSet("dataset1", {"type": "raw"})
+    operation = DataOperation("operation1", {"code": "rc_merge"})
+    operation.add_input([dataset])
+    operation.add_output([dataset])
+    template = DataPipeline("template")
+    template.add_data_operations([operation])
+
+    base = template.snapshot()
+    base_triplets = base.generate_triplets()
+    assert base.is_frozen and operation.is_frozen and dataset.is_frozen
+    assert template.versions[-1] is base
+
+    # snapshot() freezes the caller's components in place
+    with pytest.raises(ValueError):
+        operation.add_attribute("code_tag", "0_0_1")
+
+    run = base.thaw("run_1")
+    run.add_attribute("run", "1")
+    run.edit_data_set("dataset1").add_attribute("annotated", "yes")
+    run.add_data_operations([DataOperation("operation2")])
+
+    assert run.versions[-1] is base
+    assert base.generate_triplets() == base_triplets
+    assert set(run.list_component_names()) == {"run_1", "operation1", "operation2", "dataset1"}
+    assert "rc:annotated_yes a rc:AttributeValue" in "".join(run.generate_triplets())
+    assert base.attributes == {}
+    assert dataset.attributes == {"type": "raw"}
+
+    # unchanged components are shared between versions
+    run_dataset = run.edit_data_set("dataset1")
+    assert run_dataset is not dataset
+    assert run.get_component(DataSet, "dataset1") is run_dataset
+    second_run = base.thaw("run_2")
+    second_run.edit_data_operation("operation1").add_attribute("code_tag", "0_0_2")
+    assert second_run.get_component(DataSet, "dataset1") is dataset
+    assert base.get_component(DataOperation, "operation1") is operation
+
+    # components added to an edited operation can be edited through the pipeline afterwards
+    new_dataset = DataSet("dataset2")
+    second_run.edit_data_operation("operation1").add_output([new_dataset])
+    assert second_run.edit_data_set("dataset2") is new_dataset
+    with pytest.raises(ValueError):
+        base.get_component(DataSet, "dataset2")
+
+    template.add_attribute("version", "0_0_2")
+    second = template.snapshot()
+    assert second.attributes == {"version": "0_0_2"}
+    assert base.attributes == {}
+    assert template.versions == tuple([base, second])
+
+    base.save_triplets_to_file(str(tmp_path / "base.ttl"))
+    assert (tmp_path / "base.ttl").exists()
+
+
+def test__provenance_component__thaw_requires_frozen() -> None:
+    with pytest.raises(ValueError):
+        DataInstance("instance1").thaw()
+
+
+def test__data_pipeline__edit_shared_data_set() -> None:
+    ins1 = DataInstance("instance1")
+    ds1 = DataSet("dataset1")
+    ds1.add_data_instances([ins1])
+    ds2 = DataSet("dataset2")
+    ds2.add_data_instances([ins1])
+    op1 = DataOperation("operation1")
+    op1.add_output([ds1])
+    op2 = DataOperation("operation2")
+    op2.add_input([ds1])
+    op2.add_output([ds2])
+    pipe = DataPipeline("pipe1")
+    pipe.add_data_operations([op1, op2])
+    base = pipe.snapshot()
+
+    run = base.thaw()
+    run.edit_data_set("dataset1").add_attribute("x", "y")
+    run.edit_data_instance("instance1").add_attribute("annotated", "yes")
+
+    assert run.edit_data_set("dataset1").attributes == {"x": "y"}
+    assert not run.get_component(DataSet, "dataset2").is_frozen
+
+    triplets = run.generate_triplets()
+    dataset_triplets = [triplet for triplet in triplets if triplet.startswith("rc:dataset1 a rc:DataSet")]
+    assert len(dataset_triplets) == 1
+    assert "rc:hasAttributeValue rc:x_y" in dataset_triplets[0]
+    instance_triplets = [triplet for triplet in triplets if triplet.startswith("rc:instance1 a rc:DataInstance")]
+    assert len(instance_triplets) == 1
+    assert "rc:hasAttributeValue rc:annotated_yes" in instance_triplets[0]
+
+    assert base.get_component(DataSet, "dataset1") is ds1
+    assert base.get_component(DataInstance, "instance1") is ins1
+    assert ds1.attributes == {} and ins1.attributes == {}
+    assert "annotated_yes" not in "".join(base.generate_triplets())
+
+
+def test__provenance_component__attributes_are_read_only() -> None:
+    operation = DataOperation("operation1", {"code": "rc_merge"})
+    pipe = DataPipeline("pipe1", {"version": "0_0_1"})
+    pipe.add_data_operations([operation])
+    base = pipe.snapshot()
+    run = base.thaw("run_1")
+
+    for component in (base, run, operation, run.edit_data_operation("operation1")):
+        with pytest.raises(TypeError):
+            component.attributes["leak"] = "x"  # type: ignore[index]
+
+    run.add_attribute("run", "1")
+    assert base.attributes == {"version": "0_0_1"}
+    assert operation.attributes == {"code": "rc_merge"}